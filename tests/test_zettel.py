@@ -0,0 +1,38 @@
+import pytest
+
+from zettelgeist import zettel
+
+
+def test_get_yaml_writes_shared_lists_without_aliases():
+    shared = ["a", "b"]
+    z = zettel.Zettel({"tags": shared, "mentions": shared})
+
+    assert z.get_yaml() == "tags:\n- a\n- b\nmentions:\n- a\n- b\n"
+
+
+def test_extend_list_field_without_values_adds_nothing():
+    z = zettel.Zettel({"title": "T"})
+    z.extend_list_field("mentions", [])
+
+    assert "mentions" not in z.zettel
+    assert z.get_yaml() == "title: T\n"
+
+
+def test_extend_list_field_skips_duplicates():
+    z = zettel.Zettel({"tags": ["a"]})
+    z.extend_list_field("tags", ["b", "a", "b", "c"])
+    z.append_list_field("tags", "a")
+
+    assert z.zettel["tags"] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize(
+    "note",
+    ["2020-13-45", "!!bool maybe", "!!int ''", "!!float ''", "!!timestamp abc"],
+)
+def test_load_pure_yaml_skips_unconstructible_scalar(tmp_path, capsys, note):
+    filepath = tmp_path / "bad-scalar.yaml"
+    filepath.write_text("title: Bad scalar\nnote: %s\n" % note)
+
+    assert zettel.load_pure_yaml(str(filepath)) == ({}, "")
+    assert "Cannot load first YAML document" in capsys.readouterr().out
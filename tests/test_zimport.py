@@ -0,0 +1,29 @@
+import sqlite3
+import sys
+
+import pytest
+
+from zettelgeist import zimport
+
+
+def test_import_keeps_rows_before_failing_file(tmp_path, monkeypatch):
+    zettel_dir = tmp_path / "zettels"
+    (zettel_dir / "later").mkdir(parents=True)
+    (zettel_dir / "a.yaml").write_text("title: A\n")
+    (zettel_dir / "b.yaml").write_text("title: B\n")
+    # Sub-folders are walked after files, so this non-UTF-8 file comes last
+    (zettel_dir / "later" / "c.md").write_bytes(b"---\ntitle: \xff\n---\n")
+    database = tmp_path / "zettels.db"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["zimport", "--database", str(database), "--dir", str(zettel_dir)],
+    )
+
+    with pytest.raises(UnicodeDecodeError):
+        zimport.main()
+
+    conn = sqlite3.connect(database)
+    titles = sorted(row[0] for row in conn.execute("SELECT title FROM zettels"))
+    conn.close()
+    assert titles == ["A", "B"]
@@ -85,12 +85,11 @@ class SQLiteFTS(object):
     def update_index(self, table_name, field_name, items):
         if not items:
             return
-        for item in items:
-            self.cursor.execute(
-                "INSERT INTO %(table_name)s (%(field_name)s) VALUES (?)" % vars(),
-                (item,),
-            )
-            # NB: (item,) means to pack this item into a tuple as required by sqlite3.
+        self.cursor.executemany(
+            "INSERT INTO %(table_name)s (%(field_name)s) VALUES (?)" % vars(),
+            [(item,) for item in items],
+        )
+        # NB: (item,) means to pack this item into a tuple as required by sqlite3.
 
     def insert_into_table(self):
         sql_params = ",".join(self.fts_fields.values())
@@ -98,7 +97,7 @@ class SQLiteFTS(object):
         sql_insert_values = list(self.record.values())
         insert_sql = "INSERT INTO zettels (%s) VALUES (%s)" % (sql_columns, sql_params)
         self.cursor.execute(insert_sql, sql_insert_values)
-        self.conn.commit()
+        # No commit per Zettel: a bulk import is one transaction, committed by done()
         self.update_index("tags", "tag", self.zettel.get_list_field("tags"))
         self.update_index("mentions", "mention", self.zettel.get_list_field("mentions"))
 
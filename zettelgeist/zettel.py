@@ -3,17 +3,28 @@
 #
 
 import argparse
-import readline  # for input()
 import sys
 
 import frontmatter  # to accommodate Markdown with YAML frontmatter
 import yaml
 
 try:
-    from yaml import CDumper as Dumper
-    from yaml import CLoader as Loader
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as Loader
 except ImportError:
-    from yaml import Loader, Dumper
+    from yaml import SafeDumper
+    from yaml import SafeLoader as Loader
+
+
+# Zettel values are emitted as-is (not copied), so lists or dicts shared
+# between fields (e.g. via a YAML alias in the source) must not be written
+# back out as &anchor/*alias.
+
+
+class Dumper(SafeDumper):
+    def ignore_aliases(self, data):
+        return True
+
 
 import json
 import os
@@ -41,6 +52,17 @@ ZettelFieldsOrdered = (
     ZettelStringFields + ZettelListFields + ZettelStructuredFields + ZettelExtraFields
 )
 ZettelFields = set(ZettelFieldsOrdered)
+# Sets for membership tests; the lists above keep the field order
+ZettelStringFieldsSet = frozenset(ZettelStringFields)
+ZettelListFieldsSet = frozenset(ZettelListFields)
+ZettelStructuredFieldsSet = frozenset(ZettelStructuredFields)
+ZettelExtraFieldsSet = frozenset(ZettelExtraFields)
+# String fields checked by parse_zettel (filename is not part of the YAML)
+ZettelCheckedStringFields = tuple(ZettelStringFields) + ("document",)
+# The extra fields (filename, Markdown document) are never emitted as YAML
+ZettelYAMLFieldsOrdered = [
+    field for field in ZettelFieldsOrdered if field not in ZettelExtraFieldsSet
+]
 CitationFields = set(["bibkey", "page"])
 DatesFields = set(["year", "era"])
 
@@ -68,21 +90,13 @@ def parse_zettel(doc):
     parse_check_zettel_field_names(doc)
 
     # These fields are all optional but, if present, must be strings
-    parse_string_field(doc, "title")
-    parse_string_field(doc, "bibkey")
-    parse_string_field(doc, "bibtex")
-    parse_string_field(doc, "ris")
-    parse_string_field(doc, "inline")
-    parse_string_field(doc, "url")
-    parse_string_field(doc, "summary")
-    parse_string_field(doc, "comment")
-    parse_string_field(doc, "note")
-    parse_string_field(doc, "document")
+    for field in ZettelCheckedStringFields:
+        parse_string_field(doc, field)
 
     # These fields are all optional but, if present, must be list of strings
 
-    parse_list_of_string_field(doc, "tags")
-    parse_list_of_string_field(doc, "mentions")
+    for field in ZettelListFields:
+        parse_list_of_string_field(doc, field)
 
     parse_citation(doc, "cite")
     parse_dates(doc, "dates")
@@ -90,6 +104,22 @@ def parse_zettel(doc):
     # TODO: Check for extraneous fields in all cases
 
 
+# Validate a single field of an already-valid Zettel (used after each edit).
+
+
+def parse_zettel_field(doc, field):
+    if field not in ZettelFields:
+        raise ParseError("Invalid field %s found in Zettel" % field)
+    if field in ZettelStringFieldsSet or field == "document":
+        parse_string_field(doc, field)
+    elif field in ZettelListFieldsSet:
+        parse_list_of_string_field(doc, field)
+    elif field == "cite":
+        parse_citation(doc, field)
+    elif field == "dates":
+        parse_dates(doc, field)
+
+
 def parse_check_zettel_field_names(doc):
     check_field_names(doc, ZettelFields, "Zettel")
 
@@ -103,9 +133,11 @@ def parse_check_dates_field_names(doc):
 
 
 def check_field_names(doc, name_set, label):
-    for key in doc.keys():
-        if key not in name_set:
-            raise ParseError("Invalid field %s found in %s" % (key, label))
+    invalid = doc.keys() - name_set
+    if invalid:
+        # Report the first offending key in document order
+        key = next(key for key in doc if key in invalid)
+        raise ParseError("Invalid field %s found in %s" % (key, label))
 
 
 def parse_string_field(doc, field, required=False):
@@ -149,15 +181,19 @@ def parse_list_of_string_field(doc, field, required=False):
             % (field, value, typename(value))
         )
 
-    # Make a dictionary of the list items for checking purposes only
-    # That is, treat the list like a dictionary. Will simplify with comprehension magic later
-    doc2 = {}
-    pos = 0
-    for item in value:
-        doc2["%s(%d)" % (field, pos)] = item
-        pos = pos + 1
-    for key in doc2.keys():
-        parse_string_field(doc2, key, True)
+    # Each list item is a required string; messages name it as field(pos)
+    for pos, item in enumerate(value):
+        if isinstance(item, str):
+            continue
+        if item is None:
+            raise ParseError(
+                "Field %s(%d) requires a string but found %s of type %s"
+                % (field, pos, item, typename(item))
+            )
+        raise ParseError(
+            "Field %s(%d) must be a string or not present at all - found value %s of type %s"
+            % (field, pos, item, typename(item))
+        )
 
 
 def parse_citation(doc, field):
@@ -192,15 +228,19 @@ from collections import OrderedDict
 
 
 class quoted(str):
-    pass
+    __slots__ = ()
 
 
 class literal(str):
-    pass
+    __slots__ = ()
+
+
+# Note: The libyaml emitter only accepts exact str scalars, so the str
+# subclasses above are converted back to plain str when presented.
 
 
 def quoted_presenter(dumper, data):
-    return dumper.represent_scalar("tag:yaml.org,2002:str", data, style='"')
+    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data), style='"')
 
 
 # Note: Only use multiline syntax when there are actually multiple lines.
@@ -208,14 +248,21 @@ def quoted_presenter(dumper, data):
 
 def str_presenter(dumper, data):
     if len(data.splitlines()) > 1:
-        return dumper.represent_scalar("tag:yaml.org,2002:str", data, style="|")
-    return dumper.represent_scalar("tag:yaml.org,2002:str", data)
+        return dumper.represent_scalar("tag:yaml.org,2002:str", str(data), style="|")
+    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data))
 
 
 def ordered_dict_presenter(dumper, data):
     return dumper.represent_dict(data.items())
 
 
+# Representers are registered once, against the Dumper actually used.
+
+yaml.add_representer(quoted, quoted_presenter, Dumper=Dumper)
+yaml.add_representer(literal, str_presenter, Dumper=Dumper)
+yaml.add_representer(OrderedDict, ordered_dict_presenter, Dumper=Dumper)
+
+
 class ZettelBadKey(Exception):
     def __init__(self, name):
         self.name = name
@@ -226,7 +273,19 @@ class ZettelStringRequired(Exception):
         self.value = value
 
 
+# The parser is built on first use and reused thereafter.
+
+_PARSER = None
+
+
 def get_argparse():
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = build_argparse()
+    return _PARSER
+
+
+def build_argparse():
     parser = argparse.ArgumentParser()
 
     # note is being deprecated in future releases to give users time to migrate away from it
@@ -340,7 +399,7 @@ def get_argparse():
         "--restrict-output-fields",
         nargs="+",
         help="restrict output fields (list of Zettel field names)",
-        default=ZettelFieldsOrdered,
+        default=ZettelFields,
     )
 
     # deprecated
@@ -354,21 +413,30 @@ def get_argparse():
     return parser
 
 
+# Iterative (explicit stack) so long lists neither copy slices nor recurse.
+
+
 def flatten(item):
-    if item == None:
-        return [""]
-    elif isinstance(item, dict):
-        return flatten([":".join([k, item[k]]) for k in item])
-    elif not isinstance(item, (tuple, list)):
-        return [str(item)]
-
-    if len(item) == 0:
-        return item
-    else:
-        return flatten(item[0]) + flatten(item[1:])
+    flat = []
+    stack = [item]
+    while stack:
+        item = stack.pop()
+        if item is None:
+            flat.append("")
+        elif isinstance(item, dict):
+            stack.extend(reversed([":".join([k, item[k]]) for k in item]))
+        elif isinstance(item, (tuple, list)):
+            stack.extend(reversed(item))
+        else:
+            flat.append(str(item))
+    return flat
 
 
 def prompt(field):
+    # readline is only needed for input() editing; importing it initializes
+    # the terminal and reads ~/.inputrc, so defer that until we prompt.
+    import readline
+
     print("Enter text for %s. ctrl-d to end." % field)
     lines = []
     while True:
@@ -381,25 +449,31 @@ def prompt(field):
     return lines
 
 
+# Zettel validates its whole dictionary once, on construction. Every
+# mutator below re-validates only the field it changed.
+
+
 class Zettel(object):
-    def __init__(self, data={}):
-        self.zettel = data
+    __slots__ = ("zettel",)
+
+    def __init__(self, data=None):
+        # A shared {} default would leak fields between Zettel() instances
+        self.zettel = data if data is not None else {}
         parse_zettel(self.zettel)
 
     def set_field(self, name, value):
         self.zettel[name] = value
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, name)
 
     def delete_field(self, name):
         try:
             del self.zettel[name]
-        except:
+        except KeyError:
             pass
-        parse_zettel(self.zettel)
 
     def reset_list_field(self, name):
         self.zettel[name] = []
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, name)
 
     def delete_list_field_entries(self, name, positions):
         if name not in self.zettel:
@@ -411,11 +485,20 @@ class Zettel(object):
             del self.zettel[name]
 
     def append_list_field(self, name, value):
-        self.zettel[name] = self.zettel.get(name, [])
-        tag_set = set(self.zettel[name])
-        if not value in tag_set:
-            self.zettel[name].append(value)
-            parse_zettel(self.zettel)
+        self.extend_list_field(name, [value])
+
+    def extend_list_field(self, name, values):
+        # Appends each new value in order, building the duplicate set once.
+        # With no values the field is left untouched (no empty list added).
+        if len(values) == 0:
+            return
+        items = self.zettel.setdefault(name, [])
+        seen = set(items)
+        for value in values:
+            if value not in seen:
+                items.append(value)
+                seen.add(value)
+        parse_zettel_field(self.zettel, name)
 
     def get_list_field(self, name):
         return self.zettel.get(name, [])
@@ -425,7 +508,7 @@ class Zettel(object):
         if page != None:
             citation["page"] = page
         self.zettel["cite"] = citation
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, "cite")
 
     def has_citation(self):
         return "cite" in self.zettel
@@ -435,14 +518,14 @@ class Zettel(object):
             return
         if self.has_citation():
             self.zettel["cite"]["bibkey"] = bibkey
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, "cite")
 
     def set_cite_page(self, page):
         if len(page) == 0:
             return
         if self.has_citation():
             self.zettel["cite"]["page"] = page
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, "cite")
 
     def has_dates(self):
         return "dates" in self.zettel
@@ -452,51 +535,47 @@ class Zettel(object):
             return
         if self.has_dates():
             self.zettel["dates"]["year"] = year
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, "dates")
 
     def set_dates_era(self, era):
         if len(era) == 0:
             return
         if self.has_dates():
             self.zettel["dates"]["era"] = era
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, "dates")
 
     def set_dates(self, year, era=None):
         dates = {"year": year}
         if era != None:
             dates["era"] = era
         self.zettel["dates"] = dates
-        parse_zettel(self.zettel)
+        parse_zettel_field(self.zettel, "dates")
 
     def load_field(self, name, filename):
-        text = []
         with open(filename, "r") as infile:
-            text = infile.readlines()
-        text = "".join(text)
-        text = text.strip()
+            text = infile.read().strip()
         self.set_field(name, text)
-        parse_zettel(self.zettel)
 
-    def get_yaml(self, restrict_to_fields=ZettelFieldsOrdered):
-        yaml.add_representer(quoted, quoted_presenter)
-        yaml.add_representer(literal, str_presenter)
-        yaml.add_representer(OrderedDict, ordered_dict_presenter)
-        parse_zettel(self.zettel)
+    def get_yaml(self, restrict_to_fields=ZettelFields):
+        # Membership is tested per field, so test against a set; the default
+        # (and --restrict-output-fields default) is already one.
+        if isinstance(restrict_to_fields, (set, frozenset)):
+            restrict_set = restrict_to_fields
+        else:
+            restrict_set = frozenset(restrict_to_fields)
         yaml_zettel = OrderedDict()
-        for key in ZettelFieldsOrdered:
+        for key in ZettelYAMLFieldsOrdered:
             if key not in self.zettel:
                 continue
-            if key not in restrict_to_fields:
+            if key not in restrict_set:
                 continue
-            if key in ZettelStringFields:
+            if key in ZettelStringFieldsSet:
                 yaml_zettel[key] = literal(self.zettel[key])
-            elif key != "document":  # Only field not allowed is Markdown document
-                try:
-                    yaml_zettel[key] = self.zettel[key].copy()
-                except:
-                    print("Warning: Cannot copy %s" % key)
+            else:
+                # List and structured fields: no copy needed, the dumper only reads them
+                yaml_zettel[key] = self.zettel[key]
         if len(yaml_zettel) > 0:
-            return yaml.dump(yaml_zettel, default_flow_style=False)
+            return yaml.dump(yaml_zettel, default_flow_style=False, Dumper=Dumper)
         else:
             return ""
 
@@ -527,13 +606,12 @@ class Zettel(object):
     #         text.append("\n")
     #     return "\n".join(text)
 
-    def get_yaml_subset(self, fields=[]):
+    def get_yaml_subset(self, fields=None):
         z = Zettel({})
-        for field in fields:
+        for field in fields or []:
             z.zettel[field] = self.zettel[field].copy()
 
     def get_indexed_representation(self):
-        parse_zettel(self.zettel)
         return {key: ",".join(flatten(self.zettel[key])) for key in self.zettel}
 
 
@@ -558,29 +636,43 @@ def load_pure_yaml(filepath):
     with open(filepath) as infile:
         try:
             text = infile.read()
-        except:
+        except (OSError, UnicodeDecodeError):
             print("- Warning: I/O error on %s; is doc UTF-8" % filepath)
             return (ydoc, document)
         try:
             ydocs = yaml.load_all(text, Loader=Loader)
-        except:
+        except yaml.YAMLError:
             print(
                 "- Warning: Cannot load YAML from %s; consider running YAML linter"
                 % filepath
             )
             return (ydoc, document)
 
+        # Constructing a document can raise more than YAMLError (a bad
+        # timestamp or tagged scalar gives ValueError, KeyError, IndexError,
+        # ...); any of them just means the file is skipped.
         try:
             ydoc = next(ydocs)
-        except:
+        except Exception:
             print("- Warning: Cannot load first YAML document from %s" % filepath)
             return (ydoc, document)
     return (ydoc, document)
 
 
+# Leading delimiters that frontmatter's YAML, TOML, and JSON handlers detect
+FrontmatterDelimiters = ("---", "+++", "{")
+
+
 def load_markdown_with_frontmatter(filepath):
     # print("Importing Markdown with Frontmatter: %s" % filepath)
-    post = frontmatter.load(filepath)
+    with open(filepath, encoding="utf-8") as infile:
+        text = infile.read()
+    # Plain Markdown (no frontmatter) skips frontmatter's handler detection
+    # and parsing; like frontmatter, the content is returned stripped.
+    content = text.strip()
+    if not content.startswith(FrontmatterDelimiters):
+        return ({}, content)
+    post = frontmatter.loads(text)
     return (post.metadata, post.content)
 
 
@@ -698,8 +790,8 @@ def main():
         yaml_repr_stripped = first_zettel.get_yaml(args.restrict_output_fields).rstrip()
         document = first_zettel.get_document()
         if len(yaml_repr_stripped) > 0:
-            outfile.write(
-                "\n".join(["---", yaml_repr_stripped, "---", document.rstrip()]) + "\n"
+            outfile.writelines(
+                ("---\n", yaml_repr_stripped, "\n---\n", document.rstrip(), "\n")
             )
         else:
             doc_stripped = document.rstrip()
@@ -731,123 +823,157 @@ def gen_new_zettels(args):
         yield process_zettel_command_line_options(Zettel(), vargs, next(id_gen))
 
 
-def process_zettel_command_line_options(z, vargs, id):
-    # --reset-*, --delete-*, and --remove_entries_in-* are evaluated first
-    for arg in vargs:
-        if not vargs[arg]:
-            continue
+# Command-line option handlers, keyed by the option's dest prefix.
+# Each handler receives (zettel, field name, option value, zettel id).
+
+
+def _reset_option(z, field, value, id):
+    z.reset_list_field(field)
+
+
+def _delete_option(z, field, value, id):
+    z.delete_field(field)
+
+
+def _remove_entries_option(z, field, value, id):
+    try:
+        (zettel_id, list_entries) = value[:2]
+        zettel_id = int(zettel_id)
+        list_entries = [int(pos) for pos in list_entries.split(",")]
+    except ValueError:
+        print(
+            "Non-integer zettel ID or list position found in remove_entries_in_%s. Aborting."
+            % field
+        )
+        sys.exit(1)
+    if id == zettel_id:
+        z.delete_list_field_entries(field, list_entries)
+
 
-        if arg.startswith("reset_"):
-            reset_what = arg[len("reset_") :]
-            z.reset_list_field(reset_what)
+def _set_option(z, field, value, id):
+    if field == "cite":
+        bibkey = value[0]
+        pages = ",".join(value[1:])
 
-        if arg.startswith("delete_"):
-            delete_what = arg[len("delete_") :]
-            z.delete_field(delete_what)
+        if z.has_citation():
+            z.set_cite_bibkey(bibkey)
+            z.set_cite_page(pages)
+        else:
+            z.set_citation(bibkey, pages)
+
+    elif field == "dates":
+        year = value[0]
+        era = ",".join(value[1:])
+        if z.has_dates():
+            z.set_dates_year(year)
+            z.set_dates_era(era)
+        else:
+            z.set_dates(year, era)
 
-        if arg.startswith("remove_entries_in_"):
-            delete_what = arg[len("remove_entries_in_") :]
+    else:
+        z.set_field(field, value.replace(r"\n", "\n"))
+
+
+def _prompt_option(z, field, value, id):
+    lines = prompt(field)
+    if field in ZettelStringFieldsSet:
+        z.set_field(field, "\n".join(lines))
+    elif field in ZettelExtraFieldsSet:
+        z.set_field(field, "\n".join(lines))
+    elif field in ZettelListFieldsSet:
+        z.extend_list_field(field, lines)
+    elif field == "dates":
+        if len(lines) > 0:
             try:
-                (zettel_id, list_entries) = vargs[arg][:2]
-                zettel_id = int(zettel_id)
-                list_entries = [int(pos) for pos in list_entries.split(",")]
-            except:
-                print(
-                    "Non-integer zettel ID or list position found in %s. Aborting."
-                    % arg
-                )
-                sys.exit(1)
-            if id == zettel_id:
-                z.delete_list_field_entries(delete_what, list_entries)
+                z.set_dates(lines[0], lines[1])
+            except IndexError:
+                z.set_dates(lines[0])
+    elif field == "cite":
+        if len(lines) > 0:
+            try:
+                z.set_citation(lines[0], lines[1])
+            except IndexError:
+                z.set_citation(lines[0])
+
+
+def _append_option(z, field, value, id):
+    z.extend_list_field(field, value)
+
+
+def _load_option(z, field, value, id):
+    z.load_field(field, value)
 
+
+# --reset-*, --delete-*, and --remove_entries_in-* are evaluated first
+ZettelDeletionOptions = {
+    "reset_": _reset_option,
+    "delete_": _delete_option,
+    "remove_entries_in_": _remove_entries_option,
+}
+ZettelMutationOptions = {
+    "set_": _set_option,
+    "prompt_": _prompt_option,
+    "append_": _append_option,
+    "load_": _load_option,
+}
+# Maps the first word of a dest name to its full prefix
+ZettelOptionPrefixes = {
+    prefix.partition("_")[0]: prefix
+    for prefix in list(ZettelDeletionOptions) + list(ZettelMutationOptions)
+}
+
+
+def split_zettel_option(arg):
+    prefix = ZettelOptionPrefixes.get(arg.partition("_")[0])
+    if prefix is None or not arg.startswith(prefix):
+        return (None, None)
+    return (prefix, arg[len(prefix) :])
+
+
+def process_zettel_command_line_options(z, vargs, id):
+    options = []
     for arg in vargs:
         if not vargs[arg]:
             continue
-        if arg == "set_cite":
-            cite_info = vargs[arg]
-            bibkey = cite_info[0]
-            pages = ",".join(cite_info[1:])
-
-            if z.has_citation():
-                z.set_cite_bibkey(bibkey)
-                z.set_cite_page(pages)
-            else:
-                z.set_citation(bibkey, pages)
-
-        elif arg == "set_dates":
-            date_info = vargs[arg]
-            year = date_info[0]
-            era = ",".join(date_info[1:])
-            if z.has_dates():
-                z.set_dates_year(year)
-                z.set_dates_era(era)
-            else:
-                z.set_dates(year, era)
-
-        elif arg.startswith("set_"):
-            set_what = arg[len("set_") :]
-            value = vargs[arg].replace(r"\n", "\n")
-            z.set_field(set_what, value)
-
-        elif arg.startswith("prompt_"):
-            prompt_field = arg[len("prompt_") :]
-            lines = prompt(prompt_field)
-            if prompt_field in ZettelStringFields:
-                z.set_field(prompt_field, "\n".join(lines))
-            elif prompt_field in ZettelExtraFields:
-                z.set_field(prompt_field, "\n".join(lines))
-            elif prompt_field in ZettelListFields:
-                for line in lines:
-                    z.append_list_field(prompt_field, line)
-            elif prompt_field == "dates":
-                if len(lines) > 0:
-                    try:
-                        z.set_dates(lines[0], lines[1])
-                    except:
-                        z.set_dates(lines[0])
-            elif prompt_field == "cite":
-                if len(lines) > 0:
-                    try:
-                        z.set_citation(lines[0], lines[1])
-                    except:
-                        z.set_citation(lines[0])
-
-        if arg.startswith("append_"):
-            append_what = arg[len("append_") :]
-            for text in vargs[arg]:
-                z.append_list_field(append_what, text)
-
-        if arg.startswith("load_"):
-            load_what = arg[len("load_") :]
-            z.load_field(load_what, vargs[arg])
+        (prefix, field) = split_zettel_option(arg)
+        if prefix:
+            options.append((prefix, field, vargs[arg]))
+
+    for handlers in (ZettelDeletionOptions, ZettelMutationOptions):
+        for prefix, field, value in options:
+            handler = handlers.get(prefix)
+            if handler:
+                handler(z, field, value, id)
     return z
 
 
 def get_count(counter_path, counter_name):
+    # Open the counter db once for both read and rewrite.
     # Create counter db if not present.
-    if not os.path.exists(counter_path):
-        with open(counter_path, "w") as dbfile:
-            json.dump({}, dbfile)
-
-    # Read count from counter. If non-existent, start at 0.
-    with open(counter_path, "r") as dbfile:
+    try:
+        dbfile = open(counter_path, "r+")
+    except FileNotFoundError:
+        dbfile = open(counter_path, "w+")
+        json.dump({}, dbfile)
+        dbfile.seek(0)
+
+    with dbfile:
+        # Read count from counter. If non-existent, start at 0.
         db = json.load(dbfile)
         count = db.get(counter_name, -1) + 1
 
-    # save count for next invocation
-    with open(counter_path, "w") as dbfile:
+        # save count for next invocation
         db[counter_name] = count
+        dbfile.seek(0)
+        dbfile.truncate()
         json.dump(db, dbfile)
     return count
 
 
 def dict_as_yaml(data):
-    yaml.add_representer(quoted, quoted_presenter)
-    yaml.add_representer(literal, str_presenter)
-    yaml.add_representer(OrderedDict, ordered_dict_presenter)
     presented_data = OrderedDict()
     for key in data:
-        if key in ZettelStringFields:
+        if key in ZettelStringFieldsSet:
             presented_data[key] = literal(data[key])
         else:
             presented_data[key] = data[key]
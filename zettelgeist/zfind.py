@@ -156,21 +156,30 @@ def main():
         z = next(zettels)
 
         # Handle output of YAML here
+        # Shown Zettel fields are dumped together with one get_yaml() call
+        # rather than one call per field; filename is always shown last.
         this_result_output = []
+        yaml_fields = []
+        filename_yaml = None
         for field in row.keys():
             show_field = "show_" + field
             if argsd.get(show_field, None) or argsd.get("show_all"):
                 if field == "filename":
-                    filename_yaml = yaml.dump({"filename": row["filename"]})
-                    this_result_output.append(filename_yaml.rstrip())
+                    filename_yaml = yaml.dump(
+                        {"filename": row["filename"]}, Dumper=zettel.Dumper
+                    )
                 elif field == "document":
                     continue
                 elif row[field]:
                     if z:
-                        this_result_output.append(z.get_yaml([field]).rstrip())
+                        yaml_fields.append(field)
                     else:
                         this_result_output.append("%s:" % field)
                         this_result_output.append(row[field])
+        if len(yaml_fields) > 0:
+            this_result_output.append(z.get_yaml(yaml_fields).rstrip())
+        if filename_yaml:
+            this_result_output.append(filename_yaml.rstrip())
 
         # No output if just --- and ---
         if len(this_result_output) > 0:
@@ -4,22 +4,15 @@ import os
 import os.path
 import sys
 
-import frontmatter  # to accommodate Markdown with YAML frontmatter
-import yaml
-
 from . import zdb, zettel
 
-try:
-    from yaml import CDumper as Dumper
-    from yaml import CLoader as Loader
-except ImportError:
-    from yaml import Dumper, Loader
+ZettelFileExtensions = (".yaml", ".md")
 
 
 def get_zettels(dir):
     for dirpath, dirnames, filenames in os.walk(dir):
         for filename in filenames:
-            if filename.endswith(".yaml") or filename.endswith(".md"):
+            if filename.endswith(ZettelFileExtensions):
                 yield os.path.join(dirpath, filename)
 
 
@@ -58,33 +51,36 @@ def main():
     db = zdb.get(args.database)
     zettel_dir = args.dir
 
-    for entry in get_zettels(zettel_dir):
-        if args.fullpath:
-            filepath = os.path.abspath(entry)
-        else:
-            filepath = entry
-        print("Processing %s" % filepath)
-        if filepath.endswith(".yaml"):
-            yaml_info = zettel.load_pure_yaml(filepath)
-        elif filepath.endswith(".md"):
-            yaml_info = zettel.load_markdown_with_frontmatter(filepath)
-        else:
-            print("Warning: %s is not .yaml or .md (ignoring)")
-
-        (ydoc, document) = yaml_info
-        if len(ydoc) > 0:
-            try:
-                z = zettel.Zettel(ydoc)
-            except zettel.ParseError as error:
-                error_text = str(error)
-                print("%s:\n%s" % (filepath, error_text))
-                continue
-
-            if not args.validate:
-                db.bind(z, filepath, document)
-                db.insert_into_table()
-
-    db.done()
+    # Inserts are committed together by done(); the finally keeps the rows
+    # imported so far if a later file raises.
+    try:
+        for entry in get_zettels(zettel_dir):
+            if args.fullpath:
+                filepath = os.path.abspath(entry)
+            else:
+                filepath = entry
+            print("Processing %s" % filepath)
+            if filepath.endswith(".yaml"):
+                yaml_info = zettel.load_pure_yaml(filepath)
+            elif filepath.endswith(".md"):
+                yaml_info = zettel.load_markdown_with_frontmatter(filepath)
+            else:
+                print("Warning: %s is not .yaml or .md (ignoring)")
+
+            (ydoc, document) = yaml_info
+            if len(ydoc) > 0:
+                try:
+                    z = zettel.Zettel(ydoc)
+                except zettel.ParseError as error:
+                    error_text = str(error)
+                    print("%s:\n%s" % (filepath, error_text))
+                    continue
+
+                if not args.validate:
+                    db.bind(z, filepath, document)
+                    db.insert_into_table()
+    finally:
+        db.done()
 
 
 def zcreate(args):